@@ -0,0 +1,537 @@
+from typing import Callable, Dict, List, Optional, Tuple, Union
+import numpy as np
+from proposition import (AtomicProposition, ComplexProposition, Negation, Conjunction, Disjunction,
+                         Implication, Biconditional, NAryConjunction, NAryDisjunction)
+
+class CNF:
+
+    """Tseitin-encoded formula: atoms map to variables, gates define auxiliary variables, clauses are lists of signed ints;
+    the encoding is meant for SAT solvers and for sharing common subexpressions, not for fast evaluation
+    (compile_batch, compile_packed, and compile_eval are the evaluators)
+    """
+
+    __slots__ = ('atoms', 'gates', 'clauses', 'root', 'num_vars')
+
+    def __init__(self):
+        self.atoms = {}
+        self.gates = []
+        self.clauses = []
+        self.root = 0
+        self.num_vars = 0
+
+    def __str__(self) -> str:
+        return f"CNF - vars: {self.num_vars}, atoms: {len(self.atoms)}, clauses: {len(self.clauses)}"
+
+    def assignment(self, world) -> List[bool]:
+        """Complete assignment indexed by variable: atoms read from world, auxiliary variables from their gates
+        """
+        values = [False] * (self.num_vars + 1)
+        for atom, var in self.atoms.items():
+            values[var] = atom.evaluate(world)
+        for var, op, literals in self.gates:
+            operands = [values[lit] if lit > 0 else not values[-lit] for lit in literals]
+            if op == 'and':
+                values[var] = all(operands)
+            elif op == 'or':
+                values[var] = any(operands)
+            else:
+                values[var] = operands[0] == operands[1]
+        return values
+
+    def satisfied_by(self, assignment: List[bool]) -> bool:
+        for clause in self.clauses:
+            for lit in clause:
+                if assignment[lit] if lit > 0 else not assignment[-lit]:
+                    break
+            else:
+                return False
+        return True
+
+    def evaluate(self, world) -> bool:
+        # the assignment already derives every gate from the world, so the root literal is the answer and the clause
+        # scan of satisfied_by could only recheck it
+        values = self.assignment(world)
+        return values[self.root] if self.root > 0 else not values[-self.root]
+
+def to_cnf(proposition: Union[AtomicProposition, ComplexProposition]) -> CNF:
+
+    """Tseitin transformation with common subexpression elimination: structurally equal subformulas,
+    and gates over the same operands, share one variable
+    """
+
+    cnf = CNF()
+    literals: Dict[Union[AtomicProposition, ComplexProposition], int] = {}
+    gates: Dict[Tuple[str, Tuple[int, ...]], int] = {}
+
+    def new_var() -> int:
+        cnf.num_vars += 1
+        return cnf.num_vars
+
+    def gate(op: str, operands: List[int]) -> int:
+        if op == 'iff':
+            key = (op, tuple(operands))
+        else:
+            operands = sorted(set(operands))
+            if len(operands) == 1:
+                return operands[0]
+            key = (op, tuple(operands))
+        var = gates.get(key)
+        if var is not None:
+            return var
+        var = new_var()
+        gates[key] = var
+        cnf.gates.append((var, op, tuple(operands)))
+        if op == 'and':
+            for lit in operands:
+                cnf.clauses.append([-var, lit])
+            cnf.clauses.append([var] + [-lit for lit in operands])
+        elif op == 'or':
+            for lit in operands:
+                cnf.clauses.append([var, -lit])
+            cnf.clauses.append([-var] + list(operands))
+        else:
+            a, b = operands
+            cnf.clauses.extend(([-var, -a, b], [-var, a, -b], [var, a, b], [var, -a, -b]))
+        return var
+
+    def encode(prop) -> int:
+        lit = literals.get(prop)
+        if lit is not None:
+            return lit
+        if isinstance(prop, AtomicProposition):
+            lit = new_var()
+            cnf.atoms[prop] = lit
+        elif isinstance(prop, Negation):
+            lit = -encode(prop.proposition)
+        elif isinstance(prop, (Conjunction, NAryConjunction)):
+            lit = gate('and', [encode(child) for child in NAryConjunction.normalize(prop).children])
+        elif isinstance(prop, (Disjunction, NAryDisjunction)):
+            lit = gate('or', [encode(child) for child in NAryDisjunction.normalize(prop).children])
+        elif isinstance(prop, Implication):
+            lit = gate('or', [-encode(prop.left), encode(prop.right)])
+        elif isinstance(prop, Biconditional):
+            lit = gate('iff', [encode(prop.left), encode(prop.right)])
+        else:
+            raise TypeError(f"Cannot convert {prop} to CNF.")
+        literals[prop] = lit
+        return lit
+
+    cnf.root = encode(proposition)
+    cnf.clauses.append([cnf.root])
+    return cnf
+
+# opcodes of the linearized program shared by the batch compilers
+ATOM, AND, OR, NOT, IFF = range(5)
+
+def _linearize(proposition: Union[AtomicProposition, ComplexProposition],
+               atom_index: Optional[Dict[AtomicProposition, int]] = None
+               ) -> Tuple[List[Tuple[int, Tuple[int, ...]]], Tuple[AtomicProposition, ...]]:
+
+    """Linearize a proposition into (opcode, operands) instructions in evaluation order; instruction i writes register i,
+    ATOM operands are atom indices (each atom's idx when atom_index is None), all other operands are registers, and
+    the last instruction holds the result. Also returns the atoms read, in program order
+    """
+
+    program = []
+    atoms = []
+    registers: Dict[Union[AtomicProposition, ComplexProposition], int] = {}
+
+    def emit(op: int, args: Tuple[int, ...]) -> int:
+        program.append((op, args))
+        return len(program) - 1
+
+    def visit(prop) -> int:
+        register = registers.get(prop)
+        if register is not None:
+            return register
+        if isinstance(prop, AtomicProposition):
+            atoms.append(prop)
+            if atom_index is None:
+                register = emit(ATOM, (prop.idx,))
+            elif prop in atom_index:
+                register = emit(ATOM, (atom_index[prop],))
+            else:
+                raise ValueError(f"Atomic Proposition {prop} does not have an index in atom_index.")
+        elif isinstance(prop, Negation):
+            register = emit(NOT, (visit(prop.proposition),))
+        elif isinstance(prop, (Conjunction, NAryConjunction)):
+            register = emit(AND, tuple(visit(child) for child in NAryConjunction.normalize(prop).children))
+        elif isinstance(prop, (Disjunction, NAryDisjunction)):
+            register = emit(OR, tuple(visit(child) for child in NAryDisjunction.normalize(prop).children))
+        elif isinstance(prop, Implication):
+            register = emit(OR, (emit(NOT, (visit(prop.left),)), visit(prop.right)))
+        elif isinstance(prop, Biconditional):
+            register = emit(IFF, (visit(prop.left), visit(prop.right)))
+        else:
+            raise TypeError(f"Cannot compile {prop}.")
+        registers[prop] = register
+        return register
+
+    visit(proposition)
+    return program, tuple(atoms)
+
+def compile_batch(proposition: Union[AtomicProposition, ComplexProposition],
+                  atom_index: Optional[Dict[AtomicProposition, int]] = None) -> Callable[[np.ndarray], np.ndarray]:
+
+    """Compile a proposition into a function evaluating it against a (n_worlds, n_atoms) boolean array of truth
+    assignments, where column atom_index[atom] (by default atom.idx) holds the atom's value, returning one truth value
+    per world
+    """
+
+    program, atoms = _linearize(proposition, atom_index)
+
+    def evaluate(assignments: np.ndarray) -> np.ndarray:
+        assignments = np.asarray(assignments, dtype=bool)
+        registers = []
+        for op, args in program:
+            if op == ATOM:
+                value = assignments[:, args[0]]
+            elif op == NOT:
+                value = np.logical_not(registers[args[0]])
+            elif op == IFF:
+                value = np.equal(registers[args[0]], registers[args[1]])
+            elif not args:
+                value = np.full(len(assignments), op == AND)
+            else:
+                combine = np.logical_and if op == AND else np.logical_or
+                value = registers[args[0]]
+                for arg in args[1:]:
+                    value = combine(value, registers[arg])
+            registers.append(value)
+        return registers[-1]
+
+    # the program only holds atom indices, so keep the atoms alive to pin their interned instances and ids
+    evaluate.atoms = atoms
+    return evaluate
+
+# worlds per parallel chunk of the jit kernel, each chunk reuses one register file
+_CHUNK = 1024
+
+_kernel = None
+
+def _jit_kernel():
+    # numba is imported on first use so the other compilers do not depend on it
+    global _kernel
+    if _kernel is None:
+        from numba import njit, prange
+
+        @njit(parallel=True)
+        def run_program(ops, offsets, operands, assignments, out):
+            n_worlds = assignments.shape[0]
+            n_instructions = ops.shape[0]
+            for chunk in prange((n_worlds + _CHUNK - 1) // _CHUNK):
+                registers = np.empty(n_instructions, dtype=np.uint8)
+                for world in range(chunk * _CHUNK, min(n_worlds, (chunk + 1) * _CHUNK)):
+                    for i in range(n_instructions):
+                        op = ops[i]
+                        lo = offsets[i]
+                        hi = offsets[i + 1]
+                        if op == ATOM:
+                            value = assignments[world, operands[lo]]
+                        elif op == NOT:
+                            value = 1 - registers[operands[lo]]
+                        elif op == AND:
+                            value = 1
+                            for k in range(lo, hi):
+                                if registers[operands[k]] == 0:
+                                    value = 0
+                                    break
+                        elif op == OR:
+                            value = 0
+                            for k in range(lo, hi):
+                                if registers[operands[k]] != 0:
+                                    value = 1
+                                    break
+                        else:
+                            value = 1 if registers[operands[lo]] == registers[operands[lo + 1]] else 0
+                        registers[i] = value
+                    out[world] = registers[n_instructions - 1]
+
+        _kernel = run_program
+    return _kernel
+
+def compile_jit(proposition: Union[AtomicProposition, ComplexProposition],
+                atom_index: Optional[Dict[AtomicProposition, int]] = None) -> Callable[[np.ndarray], np.ndarray]:
+
+    """Compile a proposition into a Numba-jitted function with the same contract as compile_batch, evaluating the
+    whole program per world in one fused parallel pass instead of one temporary array per operation
+    """
+
+    run_program = _jit_kernel()
+    program, atoms = _linearize(proposition, atom_index)
+    ops = np.array([op for op, _ in program], dtype=np.int8)
+    offsets = np.zeros(len(program) + 1, dtype=np.int32)
+    offsets[1:] = np.cumsum([len(args) for _, args in program])
+    operands = np.array([arg for _, args in program for arg in args], dtype=np.int32)
+
+    def evaluate(assignments: np.ndarray) -> np.ndarray:
+        assignments = np.ascontiguousarray(assignments, dtype=bool).view(np.uint8)
+        out = np.empty(len(assignments), dtype=np.uint8)
+        run_program(ops, offsets, operands, assignments, out)
+        return out.view(bool)
+
+    # the program only holds atom indices, so keep the atoms alive to pin their interned instances and ids
+    evaluate.atoms = atoms
+    return evaluate
+
+_ALL_WORLDS = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+def pack_worlds(assignments: np.ndarray) -> np.ndarray:
+
+    """Pack a (n_worlds, n_atoms) boolean array into a (n_atoms, n_batches) uint64 array, bit i of batch b holding
+    the atom's value in world 64 * b + i; padding worlds are False
+    """
+
+    assignments = np.asarray(assignments, dtype=bool)
+    n_worlds, n_atoms = assignments.shape
+    padded = np.zeros((n_atoms, -(-n_worlds // 64) * 64), dtype=bool)
+    padded[:, :n_worlds] = assignments.T
+    return np.packbits(padded, axis=1, bitorder='little').view('<u8').astype(np.uint64)
+
+def unpack_worlds(packed: np.ndarray, n_worlds: int) -> np.ndarray:
+
+    """Unpack a (n_batches,) uint64 result of compile_packed into one truth value per world
+    """
+
+    bits = np.unpackbits(np.asarray(packed, dtype='<u8').view(np.uint8), bitorder='little')
+    return bits[:n_worlds].astype(bool)
+
+def count_models(packed: np.ndarray, n_worlds: int) -> int:
+    return int(np.count_nonzero(unpack_worlds(packed, n_worlds)))
+
+def compile_packed(proposition: Union[AtomicProposition, ComplexProposition],
+                   atom_index: Optional[Dict[AtomicProposition, int]] = None) -> Callable[[np.ndarray], np.ndarray]:
+
+    """Compile a proposition into a function evaluating it against worlds bit-packed by pack_worlds, 64 worlds per
+    uint64 word, returning a (n_batches,) uint64 array; bits past the last world are unspecified
+    """
+
+    program, atoms = _linearize(proposition, atom_index)
+
+    def evaluate(packed: np.ndarray) -> np.ndarray:
+        packed = np.asarray(packed, dtype=np.uint64)
+        registers = []
+        for op, args in program:
+            if op == ATOM:
+                value = packed[args[0]]
+            elif op == NOT:
+                value = np.invert(registers[args[0]])
+            elif op == IFF:
+                value = np.invert(np.bitwise_xor(registers[args[0]], registers[args[1]]))
+            elif not args:
+                value = np.full(packed.shape[1], _ALL_WORLDS if op == AND else np.uint64(0))
+            else:
+                combine = np.bitwise_and if op == AND else np.bitwise_or
+                value = registers[args[0]]
+                for arg in args[1:]:
+                    value = combine(value, registers[arg])
+            registers.append(value)
+        return registers[-1]
+
+    # the program only holds atom indices, so keep the atoms alive to pin their interned instances and ids
+    evaluate.atoms = atoms
+    return evaluate
+
+# subformulas over at most this many atoms are folded into a truth table that fits in 64 bits
+_TABLE_ATOMS = 6
+# ...but only when they have at least this many connectives per atom, since a lookup reads every atom and never
+# short-circuits
+_TABLE_RATIO = 3
+
+def truth_table(proposition: Union[AtomicProposition, ComplexProposition], atoms: List[AtomicProposition]) -> int:
+
+    """Truth table of a proposition over the given atoms as an int: bit i is its value when atoms[j] takes bit j of i
+    """
+
+    size = 1 << len(atoms)
+    full = (1 << size) - 1
+    columns = {atom: sum(1 << i for i in range(size) if (i >> j) & 1) for j, atom in enumerate(atoms)}
+
+    def table(prop) -> int:
+        if isinstance(prop, AtomicProposition):
+            return columns[prop]
+        if isinstance(prop, Negation):
+            return full & ~table(prop.proposition)
+        if isinstance(prop, (Conjunction, NAryConjunction)):
+            result = full
+            for child in NAryConjunction.normalize(prop).children:
+                result &= table(child)
+            return result
+        if isinstance(prop, (Disjunction, NAryDisjunction)):
+            result = 0
+            for child in NAryDisjunction.normalize(prop).children:
+                result |= table(child)
+            return result
+        if isinstance(prop, Implication):
+            return (full & ~table(prop.left)) | table(prop.right)
+        if isinstance(prop, Biconditional):
+            return full & ~(table(prop.left) ^ table(prop.right))
+        raise TypeError(f"Cannot build a truth table for {prop}.")
+
+    return table(proposition)
+
+def _children(prop) -> tuple:
+    if isinstance(prop, Negation):
+        return (prop.proposition,)
+    if isinstance(prop, (Conjunction, Disjunction, Implication, Biconditional)):
+        return (prop.left, prop.right)
+    if isinstance(prop, (NAryConjunction, NAryDisjunction)):
+        return prop.children
+    return ()
+
+def compile_eval(proposition: Union[AtomicProposition, ComplexProposition],
+                 atom_index: Optional[Dict[AtomicProposition, int]] = None) -> Callable[[np.ndarray], bool]:
+
+    """Compile a proposition into a single generated lambda over an indexed world (world[atom_index[atom]], by default
+    world[atom.idx]) so evaluation runs as one bytecode expression instead of recursive method dispatch; subformulas
+    over at most six atoms with at least three connectives per atom become a single truth table lookup. Being a single
+    expression, the source is bound by the Python parser's limit of about 200 nested parentheses (roughly 200 levels
+    of Implication, 100 of Biconditional; flattened conjunctions and disjunctions and folded subformulas do not nest),
+    and deeper propositions raise ValueError: use compile_batch or evaluate for those
+    """
+
+    supports: Dict[Union[AtomicProposition, ComplexProposition], Tuple[frozenset, int]] = {}
+
+    def support(prop) -> Tuple[frozenset, int]:
+        # atoms of a subformula and its number of connectives
+        result = supports.get(prop)
+        if result is None:
+            if isinstance(prop, AtomicProposition):
+                result = (frozenset((prop,)), 0)
+            else:
+                atoms, connectives = frozenset(), 1
+                for child in _children(prop):
+                    child_atoms, child_connectives = support(child)
+                    atoms |= child_atoms
+                    connectives += child_connectives
+                result = (atoms, connectives)
+            supports[prop] = result
+        return result
+
+    def index(atom) -> int:
+        if atom_index is None:
+            return atom.idx
+        if atom not in atom_index:
+            raise ValueError(f"Atomic Proposition {atom} does not have an index in atom_index.")
+        return atom_index[atom]
+
+    def source(prop) -> str:
+        if isinstance(prop, AtomicProposition):
+            return f"w[{index(prop)}]"
+        atoms, connectives = support(prop)
+        if len(atoms) <= _TABLE_ATOMS and connectives >= _TABLE_RATIO * len(atoms):
+            atoms = sorted(atoms, key=index)
+            row = ' + '.join([f"({1 << j} if w[{index(atom)}] else 0)" for j, atom in enumerate(atoms)]) or "0"
+            return f"(({truth_table(prop, atoms)} >> ({row})) & 1)"
+        if isinstance(prop, Negation):
+            return f"(not {source(prop.proposition)})"
+        if isinstance(prop, (Conjunction, NAryConjunction)):
+            children = NAryConjunction.normalize(prop).children
+            return f"({' and '.join([source(child) for child in children])})" if children else "True"
+        if isinstance(prop, (Disjunction, NAryDisjunction)):
+            children = NAryDisjunction.normalize(prop).children
+            return f"({' or '.join([source(child) for child in children])})" if children else "False"
+        if isinstance(prop, Implication):
+            return f"((not {source(prop.left)}) or {source(prop.right)})"
+        if isinstance(prop, Biconditional):
+            return f"(bool({source(prop.left)}) == bool({source(prop.right)}))"
+        raise TypeError(f"Cannot compile {prop}.")
+
+    try:
+        code = compile(f"lambda w: bool({source(proposition)})", "<compile_eval>", "eval")
+    except (MemoryError, RecursionError, SyntaxError) as error:
+        # the parser reports too deep nesting as a stack overflow or a syntax error depending on the connective
+        raise ValueError("Proposition is nested too deeply for compile_eval, whose single generated expression allows "
+                         "about 200 nested parentheses.") from error
+    function = eval(code, {})
+    # the generated source only holds atom indices, so keep the atoms alive to pin their interned instances and ids
+    function.atoms = tuple(support(proposition)[0])
+    return function
+
+if __name__ == "__main__":
+
+    from itertools import product
+    from proposition import Constant, Predicate, PredicateExpression, num_atoms
+
+    def check(name: str, agrees: bool):
+        # raised rather than asserted so the checks still run under python -O
+        if not agrees:
+            raise AssertionError(f"{name} disagrees with proposition.evaluate")
+        print(f"{name} agrees")
+
+    # Atoms
+    people = [Constant(symbol, name) for symbol, name in (('a', 'Alice'), ('b', 'Bob'), ('c', 'Carol'))]
+    happy = Predicate(symbol='H', name='Happy', arity=1, roles=('person',))
+    friends = Predicate(symbol='F', name='FriendsWith', arity=2, roles=('person', 'friend'))
+    atoms = [PredicateExpression(predicate=happy, arguments=(person,)) for person in people]
+    atoms += [PredicateExpression(predicate=friends, arguments=pair) for pair in ((people[0], people[1]), (people[1], people[2]), (people[2], people[0]), (people[0], people[2]))]
+    ha, hb, hc, fab, fbc, fca, fac = atoms
+    atom_index = {atom: i for i, atom in enumerate(atoms)}
+
+    # Formula with a shared subformula and empty n-ary nodes (an empty conjunction is True, an empty disjunction False)
+    shared = Conjunction(fab, Negation(hb))
+    left = NAryDisjunction((shared, Implication(fbc, Conjunction(hc, fca)), NAryDisjunction(())))
+    right = Conjunction(NAryConjunction(()), Disjunction(Negation(shared), Biconditional(fac, ha)))
+    formula = Biconditional(left, right)
+
+    # Every world over the atoms, once as rows of truth values and once as dicts for proposition.evaluate
+    worlds = np.array(list(product([False, True], repeat=len(atoms))))
+    dict_worlds = [dict(zip(atoms, map(bool, row))) for row in worlds]
+    expected = np.array([formula.evaluate(world) for world in dict_worlds])
+    print(f"{formula} holds in {expected.sum()} of {len(worlds)} worlds")
+
+    # CNF
+    cnf = to_cnf(formula)
+    print(cnf)
+    check("to_cnf", all(cnf.evaluate(world) == value for world, value in zip(dict_worlds, expected)))
+    check("to_cnf clauses", all(cnf.satisfied_by(cnf.assignment(world)) == value for world, value in zip(dict_worlds, expected)))
+
+    # Batch, once with explicit columns and once with the default columns given by each atom's idx
+    idx_worlds = np.zeros((len(worlds), num_atoms()), dtype=bool)
+    idx_worlds[:, [atom.idx for atom in atoms]] = worlds
+    check("compile_batch", (compile_batch(formula, atom_index)(worlds) == expected).all())
+    check("compile_batch by idx", (compile_batch(formula)(idx_worlds) == expected).all())
+
+    # JIT, also over more worlds than one parallel chunk holds, ending part-way through the second chunk
+    try:
+        jit_formula = compile_jit(formula, atom_index)
+    except ImportError:
+        print("compile_jit skipped: numba is not installed")
+    else:
+        check("compile_jit", (jit_formula(worlds) == expected).all())
+        n_worlds = _CHUNK + len(worlds) // 2
+        repeated = np.resize(worlds, (n_worlds, len(atoms)))
+        check(f"compile_jit over {n_worlds} worlds", (jit_formula(repeated) == np.resize(expected, n_worlds)).all())
+
+    # Packed: 128 worlds fill two words exactly, 100 leave padding bits in the last one
+    packed_formula = compile_packed(formula, atom_index)
+    for n_worlds in (len(worlds), 100):
+        result = packed_formula(pack_worlds(worlds[:n_worlds]))
+        check(f"compile_packed over {n_worlds} worlds", (unpack_worlds(result, n_worlds) == expected[:n_worlds]).all())
+        check(f"count_models over {n_worlds} worlds", count_models(result, n_worlds) == expected[:n_worlds].sum())
+
+    # Generated lambda, over array rows, over lists, and over worlds indexed by each atom's idx
+    generated = compile_eval(formula, atom_index)
+    check("compile_eval", all(generated(row) == value for row, value in zip(worlds, expected)))
+    check("compile_eval over lists", all(generated(row.tolist()) == value for row, value in zip(worlds, expected)))
+    check("compile_eval by idx", all(compile_eval(formula)(row) == value for row, value in zip(idx_worlds, expected)))
+    deep = ha
+    for atom in atoms[1:] * 40:
+        deep = Implication(atom, deep)
+    try:
+        compile_eval(deep)
+    except ValueError as error:
+        print(f"compile_eval rejects {len(atoms[1:] * 40)} nested implications: {error}")
+    else:
+        raise AssertionError("compile_eval accepted a proposition nested beyond the parser's limit")
+
+    # Truth tables: seven connectives over two atoms are dense enough to fold, the whole formula over four atoms is not
+    dense = Biconditional(Implication(ha, hb), Negation(Disjunction(Negation(ha), Conjunction(hb, Negation(ha)))))
+    table = truth_table(dense, [ha, hb])
+    check("truth_table", all((table >> i) & 1 == dense.evaluate({ha: bool(i & 1), hb: bool(i & 2)}) for i in range(4)))
+    folded_formula = Disjunction(Conjunction(dense, fbc), Negation(fac))
+    folded = compile_eval(folded_formula, atom_index)
+    if table not in folded.__code__.co_consts:
+        raise AssertionError("compile_eval did not fold the dense subformula into its truth table")
+    folded_expected = [folded_formula.evaluate(world) for world in dict_worlds]
+    check("compile_eval with a folded subformula", all(folded(row) == value for row, value in zip(worlds, folded_expected)))
@@ -1,11 +1,62 @@
 from typing import Set, Union, Tuple
 from abc import ABC, abstractmethod
+from collections.abc import Mapping
+from weakref import WeakValueDictionary
+import numpy as np
+
+# interning caches: equal declarations share one instance so equality reduces to identity
+_constants = WeakValueDictionary()
+_variables = WeakValueDictionary()
+_declarations = WeakValueDictionary()
+# compound terms and expressions are keyed by the ids of their (already interned) declaration and arguments
+_grounded_functions = WeakValueDictionary()
+_expressions = WeakValueDictionary()
+
+# dense ids of predicate expressions, never reused so an id always names the expression it was handed out to
+_num_atoms = 0
+
+def num_atoms() -> int:
+    """Width an array-backed world needs: one past the largest atom id handed out so far
+    """
+    return _num_atoms
+
+def _acquire_atom_id() -> int:
+    global _num_atoms
+    _num_atoms += 1
+    return _num_atoms - 1
+
+def _rebuild(cls: type, args: tuple, kwargs: dict):
+    return cls(*args, **kwargs)
+
+def _argument_hashes(arguments: tuple, threshold: int) -> list:
+    # above the threshold only the arity and a head/tail sample are hashed, __eq__ stays exact
+    if threshold is not None and len(arguments) > threshold:
+        return [len(arguments)] + [arg._hash for arg in arguments[:4]] + [arg._hash for arg in arguments[-4:]]
+    return [arg._hash for arg in arguments]
+
+def _check_terms(arguments: tuple):
+    # concrete classes first: an exact type match skips ABCMeta.__instancecheck__
+    for arg in arguments:
+        if not isinstance(arg, (Constant, Variable, GroundedFunction)) and not isinstance(arg, Term):
+            raise TypeError(f"Argument {arg} is not a Term.")
+
+def _same_arguments(left: tuple, right: tuple) -> bool:
+    return len(left) == len(right) and all(x is y for x, y in zip(left, right))
+
+def _intern(cache: WeakValueDictionary, cls: type, key: tuple):
+    obj = cache.get(key)
+    if obj is None:
+        obj = object.__new__(cls)
+        cache[key] = obj
+    return obj
 
 class Term(ABC):
     
     """Basic Term Class: subclassed by Constant, Variable, and GroundedFunction
     """
     
+    __slots__ = ()
+    
     @abstractmethod
     def __str__(self) -> str:
         pass
@@ -23,121 +74,167 @@ class Constant(Term):
     """Constant with a symbol and a name
     """
     
+    __slots__ = ('symbol', 'name', '_hash', '__weakref__')
+    
+    def __new__(cls, symbol: str, name: str = None):
+        return _intern(_constants, cls, (cls, symbol, name))
+    
+    def __reduce__(self):
+        return (type(self), (self.symbol, self.name))
+    
     def __init__(self, symbol: str, name: str = None):
         self.symbol = symbol
         self.name = name
+        self._hash = hash((type(self), self.symbol, self.name))
         
     def __str__(self) -> str:
         return self.symbol
     
     def __eq__(self, other) -> bool:
-        if isinstance(other, Constant):
-            return (other.symbol == self.symbol) and (other.name == self.name)
-        return False
+        return self is other
     
     def __hash__(self) -> int:
-        return hash((type(self), self.symbol, self.name))
+        return self._hash
 
 class Variable(Term):
     
     """Variable with a symbol
     """
     
+    __slots__ = ('symbol', '_hash', '__weakref__')
+    
+    def __new__(cls, symbol: str):
+        return _intern(_variables, cls, (cls, symbol))
+    
+    def __reduce__(self):
+        return (type(self), (self.symbol,))
+    
     def __init__(self, symbol: str):
         self.symbol = symbol
+        self._hash = hash((type(self), self.symbol))
         
     def __str__(self) -> str:
         return self.symbol
     
     def __eq__(self, other) -> bool:
-        if isinstance(other, Variable):
-            return other.symbol == self.symbol
-        return False
+        return self is other
     
     def __hash__(self) -> int:
-        return hash((type(self), self.symbol))
+        return self._hash
     
-class Function:
+class _SymbolDecl:
     
-    """Function with a symbol, name, arity, and argument roles (ix to role)
+    """Shared declaration of a symbol, name, arity, and argument roles (ix to role): subclassed by Function and Predicate
     """
     
+    __slots__ = ('symbol', 'name', 'arity', 'roles', '_hash', '__weakref__')
+    
+    def __new__(cls, symbol: str, name: str, arity: int = 0, *, roles: Tuple[str] = ()):
+        return _intern(_declarations, cls, (cls, symbol, name, arity, tuple(roles)))
+    
+    def __reduce__(self):
+        return (_rebuild, (type(self), (self.symbol, self.name, self.arity), {'roles': self.roles}))
+    
     def __init__(self, symbol: str, name: str, arity: int = 0, *, roles: Tuple[str] = ()):
         if arity != len(roles) and len(roles) != 0:
-            raise ValueError(f"Function '{symbol}' expects {arity} arguments, got {len(roles)} roles.")
+            raise ValueError(f"{type(self).__name__} '{symbol}' expects {arity} arguments, got {len(roles)} roles.")
         self.symbol = symbol
         self.name = name
         self.arity = arity
-        self.roles = roles
+        self.roles = tuple(roles)
+        self._hash = hash((type(self), self.symbol, self.name))
         
     def __str__(self) -> str:
-        return f"Function - symbol: {self.symbol}, name: {self.name}, arity: {self.arity}, roles: {self.roles}"
+        return f"{type(self).__name__} - symbol: {self.symbol}, name: {self.name}, arity: {self.arity}, roles: {self.roles}"
     
     def __eq__(self, other) -> bool:
-        if isinstance(other, Function):
+        if self is other:
+            return True
+        if isinstance(other, type(self)):
             return (self.symbol == other.symbol) and (self.name == other.name)
         return False
     
     def __hash__(self) -> int:
-        return hash((type(self), self.symbol, self.name))
+        return self._hash
+
+class Function(_SymbolDecl):
+    
+    """Function with a symbol, name, arity, and argument roles (ix to role)
+    """
+    
+    __slots__ = ()
 
 class GroundedFunction(Term):
     
     """Grounded Function with a function and arguments whose index maps to their role
     """
     
-    def __init__(self, function: Function, *, arguments: Tuple[Term] = ()):
-        for arg in arguments:
-            if not isinstance(arg, Term):
-                raise TypeError(f"Argument {arg} is not a Term.")
+    __slots__ = ('function', 'arguments', '_hash', '_str', '__weakref__')
+    
+    # arity above which hashing samples the arguments, None hashes them all
+    _partial_hash_threshold = 16
+    
+    def __new__(cls, function: Function, *, arguments: Tuple[Term] = ()):
+        # built here rather than in __init__ so an interned instance is never re-initialized
+        arguments = tuple(arguments)
+        key = (cls, id(function), *map(id, arguments))
+        self = _grounded_functions.get(key)
+        if self is not None:
+            return self
+        # per-argument validation is stripped under python -O
+        if __debug__:
+            _check_terms(arguments)
         if len(arguments) != function.arity:
             raise ValueError(f"Grounded Function expects {function.arity} arguments, but received {len(arguments)} instead.")
+        self = object.__new__(cls)
         self.function = function
         self.arguments = arguments
+        # combine the children's cached hashes directly instead of dispatching to their __hash__
+        self._hash = hash((cls, function._hash, *_argument_hashes(arguments, cls._partial_hash_threshold)))
+        self._str = None
+        _grounded_functions[key] = self
+        return self
+    
+    def __reduce__(self):
+        return (_rebuild, (type(self), (self.function,), {'arguments': self.arguments}))
         
     def __str__(self) -> str:
-        if self.arguments:
-            return f"{self.function.symbol}({', '.join(str(arg) for arg in self.arguments)})"
-        else:
-            return self.function.symbol
+        # immutable, so the rendering is computed once and reused
+        if self._str is None:
+            if self.arguments:
+                self._str = ''.join([self.function.symbol, '(', ', '.join([str(arg) for arg in self.arguments]), ')'])
+            else:
+                self._str = self.function.symbol
+        return self._str
         
     def __eq__(self, other) -> bool:
+        # terms are interned, so arguments are equal exactly when they are identical
+        if self is other:
+            return True
         if isinstance(other, GroundedFunction):
-            return (self.function == other.function) and (self.arguments == other.arguments)
+            return (self.function is other.function) and _same_arguments(self.arguments, other.arguments)
         return False
     
     def __hash__(self) -> int:
-        return hash((type(self), self.function, self.arguments))
+        return self._hash
 
-class Predicate:
+class Predicate(_SymbolDecl):
     
     """Predicate with a symbol, name, arity, and argument roles (ix to role)
     """
     
-    def __init__(self, symbol: str, name: str, arity: int = 0, *, roles: Tuple[str] = ()):
-        if arity != len(roles) and len(roles) != 0:
-            raise ValueError(f"Predicate '{symbol}' expects {arity} arguments, got {len(roles)} roles.")
-        self.symbol = symbol
-        self.name = name
-        self.arity = arity
-        self.roles = roles
-        
-    def __str__(self) -> str:
-        return f"Predicate - symbol: {self.symbol}, name: {self.name}, arity: {self.arity}, roles: {self.roles}"
-    
-    def __eq__(self, other) -> bool:
-        if isinstance(other, Predicate):
-            return (self.symbol == other.symbol) and (self.name == other.name)
-        return False
-    
-    def __hash__(self) -> int:
-        return hash((type(self), self.symbol, self.name))
+    __slots__ = ()
     
 class AtomicProposition(ABC):
     
     """Basic Atomic Proposition Class: subclassed by PredicateExpression
     """
     
+    __slots__ = ()
+    
+    # printed without enclosing parentheses when negated
+    _atomic_like = True
+    
     @abstractmethod
     def __str__(self) -> str:
         pass
@@ -151,7 +248,7 @@ class AtomicProposition(ABC):
         pass
     
     @abstractmethod
-    def evaluate(self, world):
+    def evaluate(self, world, cache=None):
         pass
 
 class PredicateExpression(AtomicProposition):
@@ -159,39 +256,76 @@ class PredicateExpression(AtomicProposition):
     """Predicate Expression with aa predicate and arguments whose index maps to their role
     """
     
-    def __init__(self, predicate: Predicate, *, arguments: Tuple[Term] = ()):
+    __slots__ = ('predicate', 'arguments', 'truth_value', 'idx', '_hash', '_str', '__weakref__')
+    
+    _partial_hash_threshold = 16
+    
+    def __new__(cls, predicate: Predicate, *, arguments: Tuple[Term] = ()):
+        # interned so equal expressions share one idx; built here so the idx is handed out exactly once
+        arguments = tuple(arguments)
+        key = (cls, id(predicate), *map(id, arguments))
+        self = _expressions.get(key)
+        if self is not None:
+            return self
         if predicate.arity != len(arguments):
             raise ValueError(f"Predicate '{predicate.symbol}' expects {predicate.arity} arguments, got {len(arguments)}.")
-        for arg in arguments:
-            if not isinstance(arg, Term):
-                raise TypeError(f"Argument {arg} is not a Term.")
+        # per-argument validation is stripped under python -O
+        if __debug__:
+            _check_terms(arguments)
+        self = object.__new__(cls)
         self.predicate = predicate
         self.arguments = arguments
         self.truth_value = None
+        self._hash = hash((cls, predicate._hash, *_argument_hashes(arguments, cls._partial_hash_threshold)))
+        self._str = None
+        self.idx = _acquire_atom_id()
+        _expressions[key] = self
+        return self
+    
+    def __reduce__(self):
+        # no state: unpickling returns the live interned instance, whose truth_value must not be overwritten
+        return (_rebuild, (type(self), (self.predicate,), {'arguments': self.arguments}))
         
     def __str__(self) -> str:
-        if self.arguments:
-            return f"{self.predicate.symbol}({', '.join(str(arg) for arg in self.arguments)})"
-        else:
-            return self.predicate.symbol
+        if self._str is None:
+            if self.arguments:
+                self._str = ''.join([self.predicate.symbol, '(', ', '.join([str(arg) for arg in self.arguments]), ')'])
+            else:
+                self._str = self.predicate.symbol
+        return self._str
         
     def __eq__(self, other) -> bool:
+        if self is other:
+            return True
         if isinstance(other, PredicateExpression):
-            return (self.predicate == other.predicate) and (self.arguments == other.arguments)
+            return (self.predicate is other.predicate) and _same_arguments(self.arguments, other.arguments)
         return False
     
     def __hash__(self) -> int:
-        return hash((type(self), self.predicate, self.arguments))
-    
-    def evaluate(self, world) -> bool:
-        if self not in world:
+        return self._hash
+    
+    def evaluate(self, world, cache=None) -> bool:
+        # world is either a mapping from expressions to truth values or a boolean array indexed by idx; exact types are
+        # checked first so the common worlds skip ABCMeta.__instancecheck__
+        world_type = type(world)
+        if world_type is dict:
+            value = world.get(self)
+        elif world_type is list or world_type is tuple or world_type is np.ndarray or not isinstance(world, Mapping):
+            value = bool(world[self.idx]) if self.idx < len(world) else None
+        else:
+            value = world.get(self)
+        if value is None:
             raise ValueError(f"Atomic Proposition {self.__str__()} does not have an assigned truth value in world.")
-        return world[self]
+        return value
 
 class ComplexProposition(ABC):
     
     """Basic Complex Proposition Type: subclassed by Negation and BinaryProposition
     """
+    
+    __slots__ = ()
+    
+    _atomic_like = False
 
     @abstractmethod
     def __str__(self) -> str:
@@ -206,7 +340,10 @@ class ComplexProposition(ABC):
         pass
     
     @abstractmethod
-    def evaluate(self, world) -> bool:
+    def evaluate(self, world, cache=None) -> bool:
+        """Truth value in world; passing a dict as cache memoizes subformulas in it, so formulas sharing
+        subformulas evaluate each of them at most once per world
+        """
         pass
 
 class Negation(ComplexProposition):
@@ -214,13 +351,25 @@ class Negation(ComplexProposition):
     """Negation class with proposiiton argument
     """
     
+    __slots__ = ('proposition', '_hash', '_str')
+    
+    _atomic_like = True
+    
     def __init__(self, proposition: Union[AtomicProposition, ComplexProposition]):
         self.proposition = proposition
+        self._hash = hash((type(self), proposition._hash))
+        self._str = None
+    
+    def __reduce__(self):
+        return (type(self), (self.proposition,))
         
     def __str__(self) -> str:
-        if isinstance(self.proposition, AtomicProposition) or isinstance(self.proposition, Negation):
-            return f"¬{self.proposition}"
-        return f"¬({self.proposition})"
+        if self._str is None:
+            if self.proposition._atomic_like:
+                self._str = f"¬{self.proposition}"
+            else:
+                self._str = f"¬({self.proposition})"
+        return self._str
     
     def __eq__(self, other) -> bool:
         if isinstance(other, Negation):
@@ -228,19 +377,38 @@ class Negation(ComplexProposition):
         return False
     
     def __hash__(self) -> int:
-        return hash((type(self), self.proposition))
-    
-    def evaluate(self, world) -> bool:
-        return not self.proposition.evaluate(world)
+        return self._hash
+    
+    def evaluate(self, world, cache=None) -> bool:
+        if cache is None:
+            return not self.proposition.evaluate(world)
+        value = cache.get(self)
+        if value is None:
+            value = cache[self] = not self.proposition.evaluate(world, cache)
+        return value
 
 class BinaryProposition(ComplexProposition):
     
     """Basic Binary Proposition Class: subclassed by Conjunction, Disjunction, Implication, and Biconditional
     """
     
+    __slots__ = ('left', 'right', '_hash', '_str')
+    
+    _symbol = None
+    
     def __init__(self, left: Union[AtomicProposition, ComplexProposition], right: Union[AtomicProposition, ComplexProposition]):
         self.left = left
         self.right = right
+        self._hash = hash((type(self), left._hash, right._hash))
+        self._str = None
+    
+    def __reduce__(self):
+        return (type(self), (self.left, self.right))
+    
+    def __str__(self) -> str:
+        if self._str is None:
+            self._str = f"({self.left} {self._symbol} {self.right})"
+        return self._str
         
     def __eq__(self, other) -> bool:
         if isinstance(other, type(self)):
@@ -248,54 +416,160 @@ class BinaryProposition(ComplexProposition):
         return False
     
     def __hash__(self) -> int:
-        return hash((type(self), self.left, self.right))
-    
-    def evaluate(self, world) -> bool:
-        pass
+        return self._hash
 
 class Conjunction(BinaryProposition):
     
     """Conjunction class with left and right proposition arguments
     """
     
-    def __str__(self) -> str:
-        return f"({self.left} ∧ {self.right})"
+    __slots__ = ()
+    
+    _symbol = "∧"
     
-    def evaluate(self, world) -> bool:
-        return self.left.evaluate(world) and self.right.evaluate(world)
+    def evaluate(self, world, cache=None) -> bool:
+        if cache is None:
+            return self.left.evaluate(world) and self.right.evaluate(world)
+        value = cache.get(self)
+        if value is None:
+            value = cache[self] = self.left.evaluate(world, cache) and self.right.evaluate(world, cache)
+        return value
 
 class Disjunction(BinaryProposition):
     
     """Disjunction class with left and right proposition arguments
     """
     
-    def __str__(self) -> str:
-        return f"({self.left} ∨ {self.right})"
+    __slots__ = ()
+    
+    _symbol = "∨"
     
-    def evaluate(self, world) -> bool:
-        return self.left.evaluate(world) or self.right.evaluate(world)
+    def evaluate(self, world, cache=None) -> bool:
+        if cache is None:
+            return self.left.evaluate(world) or self.right.evaluate(world)
+        value = cache.get(self)
+        if value is None:
+            value = cache[self] = self.left.evaluate(world, cache) or self.right.evaluate(world, cache)
+        return value
 
 class Implication(BinaryProposition):
     
     """Implication class with left and right proposition arguments
     """
     
-    def __str__(self) -> str:
-        return f"({self.left} → {self.right})"
+    __slots__ = ()
     
-    def evaluate(self, world) -> bool:
-        return ((not self.left.evaluate(world)) or self.right.evaluate(world))
+    _symbol = "→"
+    
+    def evaluate(self, world, cache=None) -> bool:
+        if cache is None:
+            return ((not self.left.evaluate(world)) or self.right.evaluate(world))
+        value = cache.get(self)
+        if value is None:
+            value = cache[self] = ((not self.left.evaluate(world, cache)) or self.right.evaluate(world, cache))
+        return value
 
 class Biconditional(BinaryProposition):
     
     """Biconditional class with left and right proposition arguments
     """
     
+    __slots__ = ()
+    
+    _symbol = "↔"
+    
+    def evaluate(self, world, cache=None) -> bool:
+        if cache is None:
+            return self.left.evaluate(world) == self.right.evaluate(world)
+        value = cache.get(self)
+        if value is None:
+            value = cache[self] = self.left.evaluate(world, cache) == self.right.evaluate(world, cache)
+        return value
+
+
+class NAryProposition(ComplexProposition):
+    
+    """Basic N-ary Proposition Class: subclassed by NAryConjunction and NAryDisjunction
+    """
+    
+    __slots__ = ('children', '_hash', '_str')
+    
+    _binary = None
+    _symbol = None
+    
+    def __init__(self, children: Tuple[Union[AtomicProposition, ComplexProposition]] = ()):
+        self.children = tuple(children)
+        self._hash = hash((type(self), *[child._hash for child in self.children]))
+        self._str = None
+    
+    def __reduce__(self):
+        return (type(self), (self.children,))
+    
+    @classmethod
+    def normalize(cls, *propositions: Union[AtomicProposition, ComplexProposition]):
+        """Flatten nested binary and n-ary nodes of the same kind into a single n-ary node
+        """
+        children = []
+        stack = list(reversed(propositions))
+        while stack:
+            proposition = stack.pop()
+            if isinstance(proposition, cls):
+                stack.extend(reversed(proposition.children))
+            elif isinstance(proposition, cls._binary):
+                stack.append(proposition.right)
+                stack.append(proposition.left)
+            else:
+                children.append(proposition)
+        return cls(tuple(children))
+        
     def __str__(self) -> str:
-        return f"({self.left} ↔ {self.right})"
+        if self._str is None:
+            self._str = ''.join(['(', f' {self._symbol} '.join([str(child) for child in self.children]), ')'])
+        return self._str
+        
+    def __eq__(self, other) -> bool:
+        if isinstance(other, type(self)):
+            return self.children == other.children
+        return False
+    
+    def __hash__(self) -> int:
+        return self._hash
+
+class NAryConjunction(NAryProposition):
+    
+    """N-ary Conjunction class with a tuple of proposition arguments
+    """
+    
+    __slots__ = ()
+    
+    _binary = Conjunction
+    _symbol = "∧"
+    
+    def evaluate(self, world, cache=None) -> bool:
+        if cache is None:
+            return all(child.evaluate(world) for child in self.children)
+        value = cache.get(self)
+        if value is None:
+            value = cache[self] = all(child.evaluate(world, cache) for child in self.children)
+        return value
+
+class NAryDisjunction(NAryProposition):
+    
+    """N-ary Disjunction class with a tuple of proposition arguments
+    """
+    
+    __slots__ = ()
+    
+    _binary = Disjunction
+    _symbol = "∨"
     
-    def evaluate(self, world) -> bool:
-        return self.left.evaluate(world) == self.right.evaluate(world)
+    def evaluate(self, world, cache=None) -> bool:
+        if cache is None:
+            return any(child.evaluate(world) for child in self.children)
+        value = cache.get(self)
+        if value is None:
+            value = cache[self] = any(child.evaluate(world, cache) for child in self.children)
+        return value
      
 if __name__ == "__main__":
     